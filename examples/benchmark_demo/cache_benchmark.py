@@ -1,12 +1,49 @@
 #!/usr/bin/env python3
 
 import argparse
+import errno
+import functools
+import gc
+import glob
 import math
+import mmap
+import multiprocessing
 import os
 import statistics
+import subprocess
 import sys
 import time
 from array import array
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; only needed for --jit
+    njit = None
+
+# Clocks selectable with --clock. "process" counts only CPU time of this
+# process, so intervals where it was preempted by other load are excluded.
+CLOCKS = {
+    "perf": time.perf_counter_ns,
+    "process": time.process_time_ns,
+}
+if hasattr(time, "CLOCK_MONOTONIC_RAW"):
+    CLOCKS["monotonic_raw"] = functools.partial(time.clock_gettime_ns, time.CLOCK_MONOTONIC_RAW)
+
+# Clock used for every timed region, set from --clock in main()
+_now = time.perf_counter_ns
+
+# Median cost of an empty _now() start/stop pair, measured in main()
+TIMER_OVERHEAD_NS = 0.0
+
+# Per-process benchmark buffers keyed by backend, see _shared_buffer()
+_BUFFERS: dict[str, object] = {}
+# Smallest element count per backend whose allocation failed in this process
+_FAILED_ELEMS: dict[str, int] = {}
 
 
 def human_bytes(n: int) -> str:
@@ -19,93 +56,466 @@ def human_bytes(n: int) -> str:
     return f"{x:.1f} {units[i]}"
 
 
-def generate_sizes(min_kb: int, max_bytes: int) -> list[int]:
-    sizes = []
+def _parse_cache_size(text: str) -> int:
+    # sysfs reports sizes like "48K" or "32M"
+    text = text.strip().upper()
+    scale = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    if text and text[-1] in scale:
+        return int(text[:-1]) * scale[text[-1]]
+    return int(text)
+
+
+def _detect_caches() -> list[tuple[str, int]]:
+    # Data/unified cache levels of CPU 0 as (name, size_bytes), smallest first
+    caches = []
+    if sys.platform.startswith("linux"):
+        for index in sorted(glob.glob("/sys/devices/system/cpu/cpu0/cache/index*")):
+            try:
+                with open(os.path.join(index, "type")) as f:
+                    if f.read().strip() == "Instruction":
+                        continue
+                with open(os.path.join(index, "level")) as f:
+                    level = int(f.read())
+                with open(os.path.join(index, "size")) as f:
+                    size = _parse_cache_size(f.read())
+            except (OSError, ValueError):
+                continue
+            caches.append((f"L{level}", size))
+    elif sys.platform == "darwin":
+        for level, key in ((1, "hw.l1dcachesize"), (2, "hw.l2cachesize"), (3, "hw.l3cachesize")):
+            try:
+                size = int(subprocess.check_output(["sysctl", "-n", key], stderr=subprocess.DEVNULL))
+            except (OSError, subprocess.CalledProcessError, ValueError):
+                continue
+            if size > 0:
+                caches.append((f"L{level}", size))
+    return sorted(caches, key=lambda c: c[1])
+
+
+def generate_sizes(min_kb: int, max_bytes: int) -> Iterator[int]:
+    # Lazy, so the first row is measured and printed without waiting on the sweep
     min_bytes = min_kb * 1024
     # Use powers of two to sweep cache sizes cleanly
-    pow_min = int(math.log2(max(1024, min_bytes)))
+    p = int(math.log2(max(1024, min_bytes)))
     pow_max = int(math.log2(max(1024, max_bytes)))
-    for p in range(pow_min, pow_max + 1):
-        sizes.append(1 << p)
-    return sizes
+    while p <= pow_max:
+        yield 1 << p
+        p += 1
 
 
-def measure_stride_reads_array(num_elements: int, stride_elems: int, min_accesses: int, warmup: bool = True) -> float:
-    # Allocate contiguous unsigned 64-bit array
-    data = array("Q", [0]) * num_elements
-
-    # Warm-up to populate caches/TLB
-    if warmup:
-        s = 0
-        for i in range(0, num_elements, stride_elems):
+def _xor_stride(data, stride_elems, loops):
+    # Scalar strided XOR over a uint64 array; compiled to machine code when numba is available
+    s = np.uint64(0)
+    n = data.shape[0]
+    for _ in range(loops):
+        i = 0
+        while i < n:
             s ^= data[i]
+            i += stride_elems
+    return s
 
-    accesses_per_loop = max(1, (num_elements + stride_elems - 1) // stride_elems)
-    loops = max(1, (min_accesses + accesses_per_loop - 1) // accesses_per_loop)
 
-    start = time.perf_counter_ns()
-    s = 0
+def _xor_indexed(data, indices, loops):
+    # Same reduction, visiting the elements in the order given by indices
+    s = np.uint64(0)
     for _ in range(loops):
-        for i in range(0, num_elements, stride_elems):
-            s ^= data[i]
-    end = time.perf_counter_ns()
+        for j in indices:
+            s ^= data[j]
+    return s
+
+
+if njit is not None:
+    _xor_stride = njit(cache=True, boundscheck=False)(_xor_stride)
+    _xor_indexed = njit(cache=True, boundscheck=False)(_xor_indexed)
+
+
+def _shuffled_indices(num_elements: int, stride_elems: int) -> np.ndarray:
+    # The same elements a strided sweep touches, in a fixed pseudo-random order
+    # so the hardware prefetcher cannot hide the miss latency
+    indices = np.arange(0, num_elements, stride_elems, dtype=np.int64)
+    np.random.default_rng(0).shuffle(indices)
+    return indices
+
+
+def _calibrate_timer(n: int = 10000) -> float:
+    samples = []
+    for _ in range(n):
+        t0 = _now()
+        t1 = _now()
+        samples.append(t1 - t0)
+    return statistics.median(samples)
+
+
+@contextmanager
+def _gc_paused():
+    # Keep cyclic GC passes out of the timed region
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def _calibrate_loops(fn, target_s: float = 0.3, alpha: float = 1.2, n_min: int = 1, n_max: int = 1_000_000) -> int:
+    # Probe with a single loop, then scale so one timed sample spans roughly
+    # the target window. This keeps the signal-to-timer-noise ratio the same
+    # whether a loop takes microseconds (L1) or a fraction of a second (DRAM).
+    measured_ns, _ = fn(1)
+    measured_s = max(1, measured_ns) / 1e9
+    return max(n_min, min(n_max, int(alpha * target_s / measured_s)))
+
+
+def _overhead_ratio(probe, loops: int, elapsed_ns: int, scale: float = 1.0) -> float:
+    # Estimate the share of a sample spent outside the memory reads: the timer
+    # calls plus dispatch, found by rerunning the loop on L1-hot data. scale
+    # extrapolates a probe that covers only part of each loop's iterations.
+    probe_loops = min(loops, 1000)
+    probe_ns, _ = probe(probe_loops)
+    loop_ns = max(0.0, probe_ns - TIMER_OVERHEAD_NS) * loops / probe_loops * scale
+    return min(1.0, (TIMER_OVERHEAD_NS + loop_ns) / max(1, elapsed_ns))
+
+
+def measure_stride_reads_array(
+    data: np.ndarray,
+    stride_elems: int,
+    target_window_s: float,
+    warmup: bool = True,
+    jit: bool = False,
+    random: bool = False,
+) -> tuple[float, float]:
+    # data is a zero-copy uint64 view of the shared buffer, see _alloc_buffer()
+    num_elements = data.shape[0]
+    # None reads data[::stride_elems] in address order
+    indices = _shuffled_indices(num_elements, stride_elems) if random else None
+
+    # Both paths run the strided reads in compiled code, so the timed region is
+    # dominated by memory loads rather than bytecode dispatch per element
+    def run(loops: int, buf: np.ndarray = data, idx: np.ndarray | None = indices) -> tuple[int, int]:
+        with _gc_paused():
+            if jit:
+                start = _now()
+                s = _xor_stride(buf, stride_elems, loops) if idx is None else _xor_indexed(buf, idx, loops)
+                end = _now()
+            else:
+                sel = slice(None, None, stride_elems) if idx is None else idx
+                start = _now()
+                s = np.uint64(0)
+                for _ in range(loops):
+                    s ^= np.bitwise_xor.reduce(buf[sel])
+                end = _now()
+        return end - start, s
+
+    # Warm-up to populate caches/TLB. The jitted kernel always gets one untimed
+    # call so that compilation (or loading from cache) stays out of the timing.
+    if warmup or jit:
+        run(1)
+
+    loops = _calibrate_loops(run, target_window_s)
+    elapsed_ns, s = run(loops)
+    if indices is None:
+        probe = functools.partial(run, buf=data[:1])
+    else:
+        probe = functools.partial(run, idx=indices[:1])
+    overhead_ratio = _overhead_ratio(probe, loops, elapsed_ns)
 
     # Prevent dead-code elimination
     if s == -1:  # impossible, just to use s
         print("", file=sys.stderr)
 
+    accesses_per_loop = max(1, (num_elements + stride_elems - 1) // stride_elems)
     total_accesses = loops * accesses_per_loop
-    ns_per_access = (end - start) / total_accesses
-    return ns_per_access
-
-
-def measure_stride_reads_list(num_elements: int, stride_elems: int, min_accesses: int, warmup: bool = True) -> float:
-    # Python list of ints (pointer indirection heavy)
-    data = list(range(num_elements))
+    # Remove the cost of the timer calls themselves from the sample
+    ns_per_access = max(0.0, elapsed_ns - TIMER_OVERHEAD_NS) / total_accesses
+    return ns_per_access, overhead_ratio
+
+
+def measure_stride_reads_list(
+    data: list[int],
+    num_elements: int,
+    stride_elems: int,
+    target_window_s: float,
+    warmup: bool = True,
+    random: bool = False,
+) -> tuple[float, float]:
+    # Python list of ints (pointer indirection heavy). Deliberately left as an
+    # interpreted loop to contrast with the compiled array kernels. Only the
+    # first num_elements entries of the shared list are read, so no copy is made.
+    if random:
+        order = _shuffled_indices(num_elements, stride_elems).tolist()
+    else:
+        order = range(0, num_elements, stride_elems)
+
+    # A per-stride kernel generated with exec() (constant stride, 8-way unrolled
+    # or as a while loop) measured 15-25% slower than this range loop on
+    # CPython 3.11, so the loop stays generic
+    def run(loops: int, order: range | list[int] = order) -> tuple[int, int]:
+        with _gc_paused():
+            start = _now()
+            s = 0
+            for _ in range(loops):
+                for i in order:
+                    s ^= data[i]
+            end = _now()
+        return end - start, s
 
     if warmup:
-        s = 0
-        for i in range(0, num_elements, stride_elems):
-            s ^= data[i]
-
-    accesses_per_loop = max(1, (num_elements + stride_elems - 1) // stride_elems)
-    loops = max(1, (min_accesses + accesses_per_loop - 1) // accesses_per_loop)
+        run(1)
 
-    start = time.perf_counter_ns()
-    s = 0
-    for _ in range(loops):
-        for i in range(0, num_elements, stride_elems):
-            s ^= data[i]
-    end = time.perf_counter_ns()
+    loops = _calibrate_loops(run, target_window_s)
+    elapsed_ns, s = run(loops)
+    # Probe with the same inner iterations (capped) all reading slot 0, so the
+    # per-element interpreter cost counts as overhead, not just the outer loop
+    probe_len = min(len(order), 1024)
+    probe = functools.partial(run, order=[0] * probe_len)
+    overhead_ratio = _overhead_ratio(probe, loops, elapsed_ns, scale=len(order) / probe_len)
 
     if s == -1:
         print("", file=sys.stderr)
 
+    accesses_per_loop = max(1, (num_elements + stride_elems - 1) // stride_elems)
     total_accesses = loops * accesses_per_loop
-    ns_per_access = (end - start) / total_accesses
-    return ns_per_access
+    # Remove the cost of the timer calls themselves from the sample
+    ns_per_access = max(0.0, elapsed_ns - TIMER_OVERHEAD_NS) / total_accesses
+    return ns_per_access, overhead_ratio
+
+
+def _alloc_buffer(size_bytes: int, hugepage: bool) -> np.ndarray:
+    # Page-populated uint64 buffer, optionally on transparent huge pages
+    if not hugepage:
+        # Storage is a plain array('Q'); replicating [0] writes every page,
+        # so each is backed by its own frame rather than the shared zero
+        # page. np.frombuffer wraps it without copying so the strided reads
+        # run in C instead of boxing each element through array.__getitem__.
+        return np.frombuffer(array("Q", [0]) * (size_bytes // 8), dtype=np.uint64)
+
+    # An anonymous mapping advised for 2 MB pages, so beyond L3 the TLB reach
+    # covers the working set and the curve shows DRAM rather than TLB misses
+    try:
+        region = mmap.mmap(-1, size_bytes, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+    except OSError as e:
+        # Only running out of memory is a per-size failure (reported as nan)
+        if e.errno == errno.ENOMEM:
+            raise MemoryError(str(e)) from e
+        raise
+    try:
+        region.madvise(mmap.MADV_HUGEPAGE)
+    except OSError as e:
+        # A configuration problem (e.g. kernel without THP) affects every size
+        raise OSError(e.errno, f"madvise(MADV_HUGEPAGE) failed for --huge: {e.strerror}") from e
+    buf = np.frombuffer(region, dtype=np.uint64)
+    try:
+        # Pre-fault the whole range in one call (Linux 5.14+)
+        region.madvise(mmap.MADV_POPULATE_WRITE)
+    except (AttributeError, OSError):
+        buf[:] = 0
+    return buf
+
+
+def _shared_buffer(backend: str, num_elements: int, max_elems: int, hugepage: bool = False):
+    # Allocate the largest buffer once per process and hand out prefixes per
+    # size, so repeats measure reads instead of allocation and first-touch
+    # page faults. If the largest size does not fit, grow the buffer to each
+    # size as the sweep reaches it, so only sizes that cannot be allocated
+    # fail. Failures are remembered so larger sizes are not retried.
+    buf = _BUFFERS.get(backend)
+    if buf is not None and len(buf) >= num_elements:
+        return buf
+    for n in dict.fromkeys((max_elems, num_elements)):
+        if n >= _FAILED_ELEMS.get(backend, n + 1):
+            continue
+        # Release the smaller buffer before allocating its replacement
+        _BUFFERS.pop(backend, None)
+        buf = None
+        try:
+            if backend == "array":
+                buf = _alloc_buffer(n * 8, hugepage)
+            else:
+                # Every slot points at the same cached small-int object, so the
+                # footprint is just the 8-byte pointer array and the reads measure
+                # pointer-array cache behaviour rather than scattered int objects
+                buf = [0] * n
+        except MemoryError:
+            _FAILED_ELEMS[backend] = n
+            continue
+        _BUFFERS[backend] = buf
+        return buf
+    raise MemoryError(f"cannot allocate {num_elements} elements for the {backend} benchmark")
+
+
+def _run_job(
+    backend: str,
+    num_elements: int,
+    max_elems: int,
+    stride_elems: int,
+    target_window_s: float,
+    warmup: bool,
+    jit: bool,
+    random: bool,
+    hugepage: bool,
+) -> tuple[float, float]:
+    # One (size, backend) sample; runs in the main process or in a pool worker
+    try:
+        buf = _shared_buffer(backend, num_elements, max_elems, hugepage)
+    except MemoryError:
+        return float("nan"), float("nan")
+    if backend == "array":
+        return measure_stride_reads_array(
+            buf[:num_elements],
+            stride_elems=stride_elems,
+            target_window_s=target_window_s,
+            warmup=warmup,
+            jit=jit,
+            random=random,
+        )
+    return measure_stride_reads_list(
+        buf,
+        num_elements=num_elements,
+        stride_elems=stride_elems,
+        target_window_s=target_window_s,
+        warmup=warmup,
+        random=random,
+    )
+
+
+def _parse_cpu_list(text: str) -> set[int]:
+    # sysfs CPU lists look like "0,4" or "0-3,8-11"
+    cpus = set()
+    for part in text.strip().split(","):
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.update(range(int(lo), int(hi) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def _physical_cores() -> list[int]:
+    # One allowed logical CPU per physical core. SMT siblings share L1/L2, so
+    # pinning two workers to siblings would have them contend for those caches.
+    if hasattr(os, "sched_getaffinity"):
+        allowed = sorted(os.sched_getaffinity(0))
+    else:
+        allowed = list(range(os.cpu_count() or 1))
+    cores = []
+    for cpu in allowed:
+        try:
+            with open(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list") as f:
+                siblings = _parse_cpu_list(f.read())
+        except (OSError, ValueError):
+            siblings = {cpu}
+        if cpu == min(siblings & set(allowed), default=cpu):
+            cores.append(cpu)
+    return cores
+
+
+def _pin_process(cpu: int, niceness: int) -> None:
+    # Pin to one core so the process measures that core's private caches
+    # without being migrated mid-sample, and raise its priority where permitted
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    try:
+        os.nice(niceness)
+    except OSError:
+        pass
+
+
+def _init_worker(cpu_queue, timer_overhead_ns: float, clock: str) -> None:
+    global TIMER_OVERHEAD_NS, _now
+    TIMER_OVERHEAD_NS = timer_overhead_ns
+    _now = CLOCKS[clock]
+    _pin_process(cpu_queue.get(), niceness=-5)
+
+
+def _coefficient_of_variation(samples: list[float]) -> float:
+    if len(samples) < 2:
+        return 0.0
+    mean = statistics.mean(samples)
+    return statistics.stdev(samples) / mean if mean > 0 else 0.0
+
+
+def _warn_overhead(backend: str, size_bytes: int, ratio: float, jit: bool) -> None:
+    if ratio <= 0.10:
+        return
+    print(
+        f"WARN: {backend} at {human_bytes(size_bytes)}: {ratio * 100:.0f}% of the sample is timer/loop overhead",
+        file=sys.stderr,
+    )
+    if ratio > 0.5:
+        hint = "rerun with --jit" if not jit and backend == "array" else "compare against --array --jit"
+        print(f"WARN: {backend} at {human_bytes(size_bytes)} measures the interpreter, not the cache; {hint}", file=sys.stderr)
 
 
 def main() -> int:
+    global TIMER_OVERHEAD_NS, _now
+
     parser = argparse.ArgumentParser(description="Measure memory access times across working set sizes using stride reads.")
-    parser.add_argument("--min-kb", type=int, default=16, help="Minimum working set size in KB (default: 16)")
+    parser.add_argument("--min-kb", type=int, default=None, help="Minimum working set size in KB (default: L1/4 if detected, else 16)")
     parser.add_argument("--max-mb", type=int, default=512, help="Maximum working set size in MB (default: 512)")
     parser.add_argument("--max-gb", type=float, default=None, help="Maximum working set size in GB (overrides --max-mb if set)")
     parser.add_argument("--stride-bytes", type=int, default=64, help="Stride in bytes between accesses (default: 64)")
-    parser.add_argument("--min-accesses", type=int, default=1_000_000, help="Minimum total element accesses per data point (default: 1,000,000)")
-    parser.add_argument("--repeats", type=int, default=3, help="Number of repeated measurements to median (default: 3)")
+    parser.add_argument("--target-window-s", type=float, default=0.3, help="Target duration in seconds of each timed sample (default: 0.3)")
+    parser.add_argument("--repeats", type=int, default=4, help="Minimum number of repeated measurements to median (default: 4)")
+    parser.add_argument("--max-repeats", type=int, default=12, help="Keep repeating until the last 4 samples are stable, up to this many (default: 12)")
+    parser.add_argument("--cv-threshold", type=float, default=0.08, help="Coefficient of variation that counts as stable (default: 0.08)")
+    parser.add_argument("--show-cv", dest="show_cv", action="store_true", help="Add a column with the coefficient of variation of the last 4 samples")
     parser.add_argument("--list", dest="use_list", action="store_true", help="Also measure Python list (slower, includes object overhead)")
     parser.add_argument("--array", dest="use_array", action="store_true", help="Also measure array('Q') contiguous memory")
+    parser.add_argument("--jit", dest="jit", action="store_true", help="Run the array benchmark through a numba-jitted kernel (requires numba)")
+    parser.add_argument("--random", dest="random", action="store_true", help="Visit the strided elements in shuffled order to defeat the hardware prefetcher")
+    parser.add_argument("--huge", dest="huge", action="store_true", help="Back the array benchmark with an mmap region advised for huge pages (Linux)")
+    parser.add_argument("--clock", choices=sorted(CLOCKS), default="perf", help="Clock for timed regions; 'process' excludes time preempted by other load (default: perf)")
     parser.add_argument("--csv", dest="csv", action="store_true", help="Output CSV format")
     parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Disable warmup loop per size")
+    parser.add_argument("--workers", type=int, default=1, help="Measure sizes up to L2 in N worker processes, one per physical core; larger sizes run one at a time (default: 1, in-process)")
+    parser.add_argument("--cpu", type=int, default=None, help="Core to pin the in-process benchmark to (default: first allowed core)")
     args = parser.parse_args()
 
+    # Emit each row as soon as it is measured, even when piped into tee/grep
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=True)
+
     # Default to both if neither explicitly chosen
     if not args.use_list and not args.use_array:
         args.use_list = True
         args.use_array = True
 
-    element_size = 8  # bytes for array('Q')
+    args.max_repeats = max(args.max_repeats, args.repeats)
+
+    if args.jit and njit is None:
+        parser.error("--jit requires numba (pip install numba)")
+    if args.huge and not hasattr(mmap, "MADV_HUGEPAGE"):
+        parser.error("--huge requires madvise(MADV_HUGEPAGE), which this platform does not provide")
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    worker_cpus = []
+    if args.workers > 1:
+        if args.cpu is not None:
+            parser.error("--cpu only applies with --workers 1; pool workers are pinned to one core each")
+        # Workers sharing a core would time each other's runs, so never wrap around
+        worker_cpus = _physical_cores()[: args.workers]
+        if len(worker_cpus) < args.workers:
+            parser.error(f"--workers {args.workers} exceeds the {len(worker_cpus)} physical core(s) available")
+        # Sizes beyond the private caches run in this process while the pool is idle
+        args.cpu = worker_cpus[0]
+    elif args.cpu is None:
+        args.cpu = min(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else 0
+    try:
+        _pin_process(args.cpu, niceness=-10)
+    except OSError as e:
+        parser.error(f"cannot pin to CPU {args.cpu}: {e}")
+
+    _now = CLOCKS[args.clock]
+    TIMER_OVERHEAD_NS = _calibrate_timer()
+
+    caches = _detect_caches()
+    if args.min_kb is None:
+        # Start well inside L1 so its plateau is visible before the first boundary
+        args.min_kb = max(1, caches[0][1] // 4 // 1024) if caches else 16
+
+    element_size = 8  # bytes per uint64 element
     stride_elems = max(1, args.stride_bytes // element_size)
 
     max_bytes = (
@@ -113,15 +523,19 @@ def main() -> int:
     )
     sizes = generate_sizes(args.min_kb, max_bytes)
 
+    # Largest size generate_sizes() will yield, so buffers can be sized up front
+    max_elems = (1 << int(math.log2(max(1024, max_bytes)))) // element_size
+    backends = [b for b, enabled in (("array", args.use_array), ("list", args.use_list)) if enabled]
+
     if args.csv:
         header_cols = [
             "bytes",
             "human",
         ]
         if args.use_array:
-            header_cols.append("ns_per_access_arrayQ")
+            header_cols += ["ns_per_access_arrayQ", "overhead_pct_arrayQ"] + (["cv_arrayQ"] if args.show_cv else [])
         if args.use_list:
-            header_cols.append("ns_per_access_list")
+            header_cols += ["ns_per_access_list", "overhead_pct_list"] + (["cv_list"] if args.show_cv else [])
         print(",".join(header_cols))
 
     # Pretty table header for human-readable mode
@@ -131,79 +545,123 @@ def main() -> int:
             "size",
         ]
         if args.use_array:
-            header_cols.append("array_Q ns/access")
+            header_cols += ["array_Q ns/access", "array_Q overhead%"] + (["array_Q cv"] if args.show_cv else [])
         if args.use_list:
-            header_cols.append("list ns/access")
+            header_cols += ["list ns/access", "list overhead%"] + (["list cv"] if args.show_cv else [])
+            print("list: [0] * N, one shared int object (measures the 8-byte pointer array)")
+        if caches:
+            print("caches: " + ", ".join(f"{name} = {human_bytes(size)}" for name, size in caches))
         print(" ".join(f"{h:>16}" for h in header_cols))
 
-    for size_bytes in sizes:
-        # For the array benchmark, element count corresponds to size_bytes / 8
-        num_elements_array = max(1, size_bytes // element_size)
+    # Tier names on each side of every detected cache boundary, e.g. "L1→L2"
+    tiers = [name for name, _ in caches] + ["DRAM"]
+    boundaries = [(size, f"{tiers[i]}→{tiers[i + 1]}") for i, (_, size) in enumerate(caches)]
+    prev_size = 0
+
+    # Only sizes that fit in a core's private caches (L1/L2) are measured in
+    # parallel. L3 and memory bandwidth are shared between cores, so larger
+    # sizes run one at a time in this process, after the pool has gone idle.
+    # This also keeps each worker's buffers no larger than the private caches.
+    private_bytes = max((size for name, size in caches if name in ("L1", "L2")), default=0)
+    if args.workers > 1 and private_bytes == 0:
+        print("WARN: cache sizes unknown; --workers has no effect and every size runs in-process", file=sys.stderr)
+
+    executor = None
+    if args.workers > 1 and private_bytes > 0:
+        cpu_queue = multiprocessing.Queue()
+        for cpu in worker_cpus:
+            cpu_queue.put(cpu)
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(cpu_queue, TIMER_OVERHEAD_NS, args.clock)
+        )
+
+    def schedule(backend: str, num_elements: int, parallel: bool):
+        # Returns a callable producing (ns_per_access, overhead_ratio). Parallel
+        # jobs start in the pool now; others run here when the result is needed.
+        job = (
+            backend,
+            num_elements,
+            private_bytes // element_size if parallel else max_elems,
+            stride_elems,
+            args.target_window_s,
+            bool(args.warmup),
+            args.jit,
+            args.random,
+            args.huge,
+        )
+        if not parallel:
+            return functools.partial(_run_job, *job)
+        return executor.submit(_run_job, *job).result
+
+    def is_parallel(size_bytes: int) -> bool:
+        return executor is not None and size_bytes <= private_bytes
+
+    # One (size, backend, repeat) measurement per job. Both backends use the
+    # same element count (size_bytes / 8) to keep access counts comparable.
+    def plan_jobs():
+        for size_bytes in sizes:
+            num_elements = size_bytes // element_size
+            # Skip absurdly small sizes that would have too few elements
+            if num_elements < 8:
+                continue
+            parallel = is_parallel(size_bytes)
+            yield size_bytes, {
+                backend: [schedule(backend, num_elements, parallel) for _ in range(args.repeats)] for backend in backends
+            }
+
+    plan = plan_jobs()
+    if executor is not None:
+        # Submit every parallel size up front so every worker stays busy
+        plan = list(plan)
 
-        # For the list benchmark, we use the same element count to keep access counts comparable.
-        num_elements_list = num_elements_array
-
-        # Skip absurdly small sizes that would have too few elements
-        if num_elements_array < 8:
-            continue
-
-        ns_array = None
-        ns_list = None
-
-        # Protect against MemoryError for very large allocations; skip if cannot allocate
-        if args.use_array:
-            try:
-                # Measure median over repeats to reduce jitter
-                samples = []
-                for _ in range(args.repeats):
-                    samples.append(
-                        measure_stride_reads_array(
-                            num_elements=num_elements_array,
-                            stride_elems=stride_elems,
-                            min_accesses=args.min_accesses,
-                            warmup=bool(args.warmup),
-                        )
-                    )
-                ns_array = statistics.median(samples)
-            except MemoryError:
-                ns_array = float("nan")
-        if args.use_list:
-            try:
+    try:
+        for size_bytes, pending in plan:
+            if not args.csv:
+                for cache_size, label in boundaries:
+                    # Only boundaries with a row on each side; none before the first row
+                    if 0 < prev_size <= cache_size < size_bytes:
+                        print(f"{'| ' + label + ' |':^{17 * len(header_cols) - 1}}".rstrip())
+            prev_size = size_bytes
+
+            # Median over repeats to reduce jitter. At cache-tier boundaries the
+            # timings can be bimodal, so keep sampling until the last 4 samples
+            # agree to within --cv-threshold or --max-repeats is reached.
+            results = {}
+            for backend, jobs in pending.items():
                 samples = []
-                for _ in range(args.repeats):
-                    samples.append(
-                        measure_stride_reads_list(
-                            num_elements=num_elements_list,
-                            stride_elems=stride_elems,
-                            min_accesses=args.min_accesses // 10,  # lists are slower
-                            warmup=bool(args.warmup),
-                        )
-                    )
-                ns_list = statistics.median(samples)
-            except MemoryError:
-                ns_list = float("nan")
-
-        if args.csv:
-            row = [str(size_bytes), human_bytes(size_bytes)]
-            if args.use_array:
-                row.append(f"{ns_array:.3f}" if ns_array is not None and not math.isnan(ns_array) else "nan")
-            if args.use_list:
-                row.append(f"{ns_list:.3f}" if ns_list is not None and not math.isnan(ns_list) else "nan")
-            print(",".join(row))
-        else:
-            cols = [
-                f"{size_bytes:>16}",
-                f"{human_bytes(size_bytes):>16}",
-            ]
-            if args.use_array:
-                cols.append(
-                    f"{ns_array:>16.2f}" if ns_array is not None and not math.isnan(ns_array) else f"{float('nan'):>16}"
-                )
-            if args.use_list:
-                cols.append(
-                    f"{ns_list:>16.2f}" if ns_list is not None and not math.isnan(ns_list) else f"{float('nan'):>16}"
-                )
-            print(" ".join(cols))
+                ratios = []
+                for job in jobs:
+                    ns, ratio = job()
+                    samples.append(ns)
+                    ratios.append(ratio)
+                cv = _coefficient_of_variation(samples[-4:])
+                parallel = is_parallel(size_bytes)
+                while len(samples) < args.max_repeats and cv > args.cv_threshold:
+                    # In the pool, top up a batch of samples at once rather than one by one
+                    batch = min(args.workers if parallel else 1, args.max_repeats - len(samples))
+                    for job in [schedule(backend, size_bytes // element_size, parallel) for _ in range(batch)]:
+                        ns, ratio = job()
+                        samples.append(ns)
+                        ratios.append(ratio)
+                    cv = _coefficient_of_variation(samples[-4:])
+                ns = statistics.median(samples)
+                ratio = statistics.median(ratios)
+                if not math.isnan(ratio):
+                    _warn_overhead(backend, size_bytes, ratio, args.jit)
+                results[backend] = (ns, ratio, cv)
+
+            if args.csv:
+                line = f"{size_bytes},{human_bytes(size_bytes)}"
+                for ns, ratio, cv in results.values():
+                    line += f",{ns:.3f},{ratio * 100:.1f}" + (f",{cv:.3f}" if args.show_cv else "")
+            else:
+                line = f"{size_bytes:>16} {human_bytes(size_bytes):>16}"
+                for ns, ratio, cv in results.values():
+                    line += f" {ns:>16.2f} {ratio * 100:>16.1f}" + (f" {cv:>16.3f}" if args.show_cv else "")
+            print(line)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
     return 0
 
@@ -4,36 +4,37 @@ Thread Overflow Program
 Creates threads continuously until the system limit is reached.
 """
 
+import itertools
 import threading
 import time
 import sys
 
-# Global counter for tracking thread creation
-thread_count = 0
-thread_count_lock = threading.Lock()
+# Monotonic thread IDs; next() on a count is atomic under the GIL, so no lock
+_counter = itertools.count()
+
+# Set once to release every parked worker thread
+_STOP = threading.Event()
 
 def worker_thread(thread_id):
     """Worker function that keeps the thread alive."""
-    global thread_count
     try:
-        # Keep thread alive indefinitely
-        while True:
-            time.sleep(1)
+        # Park on the event until main() releases us; unlike a sleep loop this
+        # never wakes up, so idle threads don't compete for the GIL
+        _STOP.wait()
     except Exception as e:
         print(f"Thread {thread_id} encountered error: {e}")
-    finally:
-        with thread_count_lock:
-            thread_count -= 1
+
+def active_workers():
+    """Count worker threads still alive (all workers are daemon threads)."""
+    return sum(1 for t in threading.enumerate() if t.daemon)
 
 def main():
-    global thread_count
-    
     print("Starting thread overflow program...")
     print("This will create threads until the system limit is reached.")
     print("Press Ctrl+C to stop early.\n")
     
     threads = []
-    thread_id = 0
+    thread_id = next(_counter)
     
     try:
         while True:
@@ -47,13 +48,11 @@ def main():
                 thread.start()
                 threads.append(thread)
                 
-                thread_id += 1
-                with thread_count_lock:
-                    thread_count += 1
+                thread_id = next(_counter)
                 
                 # Print progress every 100 threads
                 if thread_id % 100 == 0:
-                    print(f"Created {thread_id} threads... (Active: {thread_count})")
+                    print(f"Created {thread_id} threads... (Active: {active_workers()})")
                     
             except RuntimeError as e:
                 print(f"\nFailed to create thread {thread_id}: {e}")
@@ -67,14 +66,14 @@ def main():
     except KeyboardInterrupt:
         print(f"\n\nInterrupted by user.")
         print(f"Total threads created: {thread_id}")
-        print(f"Active threads: {thread_count}")
+        print(f"Active threads: {active_workers()}")
+        _STOP.set()
     
     # Wait a bit to see the final count
     print("\nWaiting 2 seconds to check final thread count...")
     time.sleep(2)
     
-    with thread_count_lock:
-        print(f"Final active thread count: {thread_count}")
+    print(f"Final active thread count: {active_workers()}")
     
     print("\nProgram exiting. Threads will be cleaned up.")
 